@@ -0,0 +1,232 @@
+import streamlit as st
+import yfinance as yf
+import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import partial
+import time
+import logging
+
+# --- 數據下載、指標計算與圖表 (與介面分離；快取以函數+參數為鍵，可跨頁面共享) ---
+
+@dataclass
+class Bars:
+    # 分析用的 K 線：各欄為獨立的 float32 陣列 (SoA)，不經 DataFrame
+    ts: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self):
+        return len(self.close)
+
+def to_bars(df):
+    if df.empty:
+        e = np.empty(0, dtype=np.float32)
+        return Bars(np.empty(0, dtype='datetime64[ns]'), e, e, e, e, e)
+    # 去掉時區保留交易所當地時間，圖表顯示與原本一致
+    # keepna=False 只丟掉整列皆空的 K 線，收盤價單獨為 NaN 的仍會進來，這裡一併剔除
+    df = df[df['Close'].notna()]
+    idx = df.index.tz_localize(None) if df.index.tz is not None else df.index
+    return Bars(idx.to_numpy(), *(df[col].to_numpy(np.float32) for col in ('Open', 'High', 'Low', 'Close', 'Volume')))
+
+def _download(ticker, inter, period):
+    # yf.download 共用模組層級的 shared._DFS，多執行緒同時呼叫會互相覆寫，
+    # 因此改用各自獨立的 Ticker.history (單一代號，欄位本身即為單層)。
+    # 不傳自訂 session：yfinance 0.2.66 只接受 curl_cffi Session (requests_cache 會被拒絕)，
+    # 且其內部已是行程層級共用的連線
+    # actions=False：不附帶用不到的 Dividends / Stock Splits 欄位，快取內容更小
+    # raise_errors=True：history 預設會吞掉網路錯誤並回傳空表，空表一旦進快取會空白整個 TTL；
+    # 改為拋出例外，失敗不會被 st.cache_data 快取，交由 _result 記錄並在下次重跑重試
+    data = yf.Ticker(ticker).history(period=period, interval=inter, actions=False, raise_errors=True)
+    # 顯示與短週期 EMA 用 float32 已足夠，記憶體與運算量減半
+    return data.astype({col: np.float32 for col in ('Open', 'High', 'Low', 'Close', 'Volume') if col in data})
+
+# --- 下載快取：TTL 對齊各週期的 K 線長度 ---
+_TTL = {"1m": 55, "5m": 280, "15m": 850, "30m": 1700}
+
+@st.cache_data(ttl=_TTL["1m"], show_spinner=False)
+def _dl_1m(ticker, period):
+    return _download(ticker, "1m", period)
+
+@st.cache_data(ttl=_TTL["5m"], show_spinner=False)
+def _dl_5m(ticker, period):
+    return _download(ticker, "5m", period)
+
+@st.cache_data(ttl=_TTL["15m"], show_spinner=False)
+def _dl_15m(ticker, period):
+    return _download(ticker, "15m", period)
+
+@st.cache_data(ttl=_TTL["30m"], show_spinner=False)
+def _dl_30m(ticker, period):
+    return _download(ticker, "30m", period)
+
+_DOWNLOADERS = {"1m": _dl_1m, "5m": _dl_5m, "15m": _dl_15m, "30m": _dl_30m}
+
+logger = logging.getLogger(__name__)
+
+# 各 (代號, 週期, 區間) 最近一次送出下載的時間；記在送出前，估計的到期只會早於快取實際到期
+_SUBMITTED = {}
+
+def _result(key, get):
+    # 下載失敗 (_download 以 raise_errors=True 拋出) 時記錄警告並暫以空表顯示；
+    # 例外不會被快取，清掉送出紀錄後下次重跑會重新下載
+    try:
+        data = get()
+    except Exception:
+        ticker, inter, period = key
+        logger.warning("%s %s (period=%s) 下載失敗，暫以空表顯示", ticker, inter, period, exc_info=True)
+        _SUBMITTED.pop(key, None)
+        data = pd.DataFrame()
+    return to_bars(data)
+
+def fetch_multi_data(ticker, intervals):
+    # 仍在 TTL 內的週期直接讀快取 (快取若被提早清掉，會在此同步補下載)；
+    # 只有過期的週期才丟進執行緒池並行下載，全部命中時不建立執行緒池
+    now = time.monotonic()
+    results = {}
+    misses = []
+    for inter in intervals:
+        period = "1d" if inter == "1m" else "5d"
+        key = (ticker, inter, period)
+        if now - _SUBMITTED.get(key, -np.inf) < _TTL[inter]:
+            results[inter] = _result(key, partial(_DOWNLOADERS[inter], ticker, period))
+        else:
+            _SUBMITTED[key] = now
+            misses.append(key)
+    if misses:
+        with ThreadPoolExecutor(max_workers=len(misses)) as ex:
+            futs = {ex.submit(_DOWNLOADERS[key[1]], ticker, key[2]): key for key in misses}
+            for f in as_completed(futs):
+                key = futs[f]
+                results[key[1]] = _result(key, f.result)
+    return results
+
+# --- EMA：有 numba 時用 njit 遞迴核心直接跑 NumPy 陣列，否則退回 pandas ---
+def _ema_py(x, span):
+    return pd.Series(x).ewm(span=span, adjust=False).mean().to_numpy()
+
+try:
+    from numba import njit
+
+    @njit(cache=True, nogil=True)
+    def _ema_nb(x, span):
+        # 與 pandas ewm(adjust=False).mean() 的 NaN 處理一致：
+        # 遇 NaN 沿用前值，下一個有效值依間隔的衰減權重併入
+        a = 2.0 / (span + 1.0)
+        out = np.empty_like(x)
+        weighted = x[0]
+        old_wt = 1.0
+        out[0] = weighted
+        for i in range(1, len(x)):
+            cur = x[i]
+            is_obs = cur == cur
+            if weighted == weighted:
+                old_wt *= 1.0 - a
+                if is_obs:
+                    if weighted != cur:
+                        weighted = (old_wt * weighted + a * cur) / (old_wt + a)
+                    old_wt = 1.0
+            elif is_obs:
+                weighted = cur
+            out[i] = weighted
+        return out
+except ImportError:
+    _ema_nb = None
+
+def ema(values, span):
+    if _ema_nb is None:
+        return _ema_py(values, span)
+    return _ema_nb(np.ascontiguousarray(values), span)
+
+@st.cache_resource
+def warm_numba():
+    # 預先觸發 JIT 編譯 (行情為 float32)，每個行程只做一次，避免首次刷新時才付出編譯成本
+    ema(np.array([1.0, 2.0], dtype=np.float32), 2)
+
+def ema_last(close, ts, span, key):
+    # 線上更新：session_state 保存最後一根「已收盤」K 線的 EMA，
+    # 之後每次刷新只對新收盤的 K 線做一步遞迴；最後一根仍在變動，每次由已收盤狀態再推一步
+    a = 2.0 / (span + 1.0)
+    state = st.session_state.get(key)
+    if state is not None:
+        i = np.searchsorted(ts, state["ts"])
+        if i < len(ts) - 1 and ts[i] == state["ts"]:
+            e = state["value"]
+            for x in close[i + 1:-1]:
+                e = a * float(x) + (1.0 - a) * e
+        else:
+            state = None  # 已移出下載窗口 (例如換日)，重新播種
+    if state is None:
+        e = float(ema(close[:-1], span)[-1])
+    st.session_state[key] = {"ts": ts[-2], "value": e}
+    return a * float(close[-1]) + (1.0 - a) * e
+
+def _pct_chg(x):
+    # 前值為 0 (停牌或盤外 1m 的零成交量) 時記為 0，避免 inf/NaN 污染平均值
+    prev = x[:-1]
+    return np.where(prev > 0, (x[1:] / np.where(prev > 0, prev, 1) - 1.0) * 100.0, 0.0)
+
+def metrics_fast(bars):
+    # 只用最後 12 根算出：當前升跌幅、當前量變、前 10 根的平均絕對變動
+    pc = _pct_chg(bars.close[-12:])
+    vc = _pct_chg(bars.volume[-12:])
+    return pc[-1], vc[-1], np.abs(pc[:-1]).mean(), np.abs(vc[:-1]).mean()
+
+def full_analysis(bars, ema_fast_p, ema_slow_p, alert_threshold, state_key, keep_ema=False):
+    if len(bars) < 15: return None
+    close = bars.close
+    
+    # 只取需要的尾段做純量運算，不再寫入整欄指標
+    p_chg, curr_v_chg, avg_10_p, avg_10_v = metrics_fast(bars)
+    curr_p_chg = abs(p_chg) # 取絕對值判斷波動
+    
+    # 判定是否觸發強力警報
+    is_extreme = (curr_p_chg > avg_10_p * alert_threshold) and (curr_v_chg > avg_10_v * alert_threshold)
+    
+    # 需要畫圖時才算整段，並隨結果返回供圖表直接使用；
+    # 否則趨勢只需最後一點 EMA，以 state_key 區分的 session_state 狀態線上更新
+    if keep_ema:
+        ema_f = ema(close, ema_fast_p)
+        ema_s = ema(close, ema_slow_p)
+        last_f, last_s = ema_f[-1], ema_s[-1]
+    else:
+        last_f = ema_last(close, bars.ts, ema_fast_p, f"ema_{state_key}_{ema_fast_p}")
+        last_s = ema_last(close, bars.ts, ema_slow_p, f"ema_{state_key}_{ema_slow_p}")
+    
+    res = {
+        "trend": "看漲" if last_f > last_s else "看跌",
+        "curr_p_chg": p_chg,
+        "curr_v_chg": curr_v_chg,
+        "avg_p": avg_10_p,
+        "avg_v": avg_10_v,
+        "is_extreme": is_extreme
+    }
+    if keep_ema:
+        res["ema_f"] = ema_f
+        res["ema_s"] = ema_s
+    return res
+
+def build_figure(bars, ema_f, ema_s, uirevision):
+    # 圖表骨架只建一次存在 session_state，每次刷新只替換 trace 數據
+    if "fig" not in st.session_state:
+        fig = go.Figure()
+        fig.add_trace(go.Candlestick(name="K線"))
+        # EMA 線改用 WebGL 繪製 (K線沒有 GL 版本)
+        fig.add_trace(go.Scattergl(mode='lines', line=dict(color='orange'), name="快速EMA"))
+        fig.add_trace(go.Scattergl(mode='lines', line=dict(color='deepskyblue'), name="慢速EMA"))
+        fig.update_layout(height=400, xaxis_rangeslider_visible=False, template="plotly_dark")
+        st.session_state.fig = fig
+    fig = st.session_state.fig
+    # 傳 NumPy 陣列給 Plotly，省去逐點的 pandas 轉換
+    x = bars.ts
+    fig.data[0].update(x=x, open=bars.open, high=bars.high, low=bars.low, close=bars.close)
+    fig.data[1].update(x=x, y=ema_f)
+    fig.data[2].update(x=x, y=ema_s)
+    # 同一代號下保留使用者的縮放/平移狀態，換代號時才重置
+    fig.layout.uirevision = uirevision
+    return fig